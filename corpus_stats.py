@@ -0,0 +1,70 @@
+"""
+Shared Corpus Statistics for E-consultation Comments
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+from sentiment_analyzer import STOP_WORDS
+
+# Translation table deleting every ASCII character that is not a letter or whitespace;
+# str.translate runs in C and is much faster than a regex substitution on large texts
+_NON_ALPHA_TABLE = str.maketrans('', '', ''.join(
+    chr(code) for code in range(128) if not (chr(code).isalpha() or chr(code).isspace())
+))
+
+# Maps non-ASCII whitespace (no-break and em spaces, etc.) to a plain space so it still
+# separates words once non-ASCII characters are dropped; U+3000 is the highest such character
+_UNICODE_SPACE_TABLE = {code: ' ' for code in range(128, 0x3001) if chr(code).isspace()}
+
+def split_words(text):
+    """
+    Lowercase text, strip everything but letters and split it into words
+    """
+    if not text.isascii():
+        text = text.translate(_UNICODE_SPACE_TABLE)
+    # Non-ASCII characters are dropped first, then ASCII punctuation and digits
+    return text.lower().encode('ascii', 'ignore').decode('ascii').translate(_NON_ALPHA_TABLE).split()
+
+def tokenize(text, stop_words=STOP_WORDS):
+    """
+    Return the words of text longer than two letters that are not stop words
+    """
+    return [word for word in split_words(text) if len(word) > 2 and word not in stop_words]
+
+@dataclass(frozen=True)
+class CorpusStats:
+    """
+    Word counts and combined texts for a set of comments
+    Built once per analysis and shared by the summarizer and word cloud generator
+    """
+    global_counter: Counter
+    per_provision_counter: dict
+    per_sentiment_counter: dict
+    provision_texts: dict
+
+def prepare_corpus_stats(comments_df, sentiments_df):
+    """
+    Tokenize every comment once and count words overall, per provision and per sentiment
+    Rows of sentiments_df must line up with comments_df, as from analyze_comments_batch
+    """
+    global_counter = Counter()
+    per_provision_counter = {}
+    per_sentiment_counter = {}
+    rows = zip(comments_df['comment_text'].to_numpy(),
+               comments_df['provision_reference'].to_numpy(),
+               sentiments_df['sentiment'].to_numpy())
+    for text, provision, sentiment in rows:
+        tokens = tokenize(text)
+        global_counter.update(tokens)
+        per_provision_counter.setdefault(provision, Counter()).update(tokens)
+        per_sentiment_counter.setdefault(sentiment, Counter()).update(tokens)
+
+    # Combined text of each provision, in order of first appearance
+    provision_texts = comments_df.groupby('provision_reference', sort=False, observed=True)['comment_text'].agg(' '.join)
+
+    return CorpusStats(
+        global_counter=global_counter,
+        per_provision_counter=per_provision_counter,
+        per_sentiment_counter=per_sentiment_counter,
+        provision_texts=provision_texts.to_dict()
+    )
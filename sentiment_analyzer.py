@@ -2,37 +2,75 @@
 Sentiment Analysis Module for E-consultation Comments
 """
 
+import os
+from multiprocessing import Pool
+import numpy as np
 import pandas as pd
-from textblob import TextBlob
-import nltk
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from collections import Counter
+from functools import lru_cache
 import re
 
-# Download required NLTK data (run once)
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('brown', quiet=True)
-    nltk.download('stopwords', quiet=True)
-except:
-    pass
+# Common English words ignored when extracting keywords; shared with the other modules
+STOP_WORDS = frozenset(['the', 'is', 'at', 'which', 'on', 'and', 'a', 'an', 'in',
+                        'to', 'for', 'of', 'with', 'as', 'by', 'that', 'this',
+                        'it', 'from', 'or', 'but', 'are', 'was', 'were', 'be',
+                        'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+                        'could', 'should', 'may', 'might', 'must', 'can', 'shall'])
+
+# Keywords are alphabetic runs of at least four letters
+_KEYWORD_RE = re.compile(r'[a-zA-Z]{4,}')
+
+# VADER loads its lexicon once; share a single analyzer across the module
+_vader = SentimentIntensityAnalyzer()
+
+# Sentiment classes, in the order used for categorical sentiment columns
+SENTIMENT_LABELS = ['Positive', 'Negative', 'Neutral']
+
+# Below this many comments, the cost of starting worker processes outweighs the speedup
+PARALLEL_MIN_COMMENTS = 500
+
+@lru_cache(maxsize=100_000)
+def _cached_sentiment(text):
+    """
+    Return (polarity, subjectivity) for a text, reusing scores for repeated comments
+    """
+    scores = _vader.polarity_scores(text)
+    # VADER's compound score is already normalised to -1..1; treat the
+    # non-neutral share of the text as its subjectivity
+    return scores['compound'], 1 - scores['neu']
+
+def _classify_and_round(polarities):
+    """
+    Classify float64 polarities into SENTIMENT_LABELS codes and round them to float32
+    Thresholds are applied before downcasting so results match analyze_sentiment
+    """
+    codes = np.full(len(polarities), SENTIMENT_LABELS.index('Neutral'), dtype=np.int8)
+    codes[polarities > 0.1] = SENTIMENT_LABELS.index('Positive')
+    codes[polarities < -0.1] = SENTIMENT_LABELS.index('Negative')
+    
+    # Only three decimals are kept, so float32 is enough for the stored scores
+    rounded = polarities.astype(np.float32)
+    np.round(rounded, 3, out=rounded)
+    return codes, rounded
+
+def _score(text):
+    """
+    Return (polarity, subjectivity) for a single text; module-level so Pool can pickle it
+    """
+    return _cached_sentiment(text)
 
 class SentimentAnalyzer:
     def __init__(self):
-        self.stop_words = set(['the', 'is', 'at', 'which', 'on', 'and', 'a', 'an', 'in', 
-                               'to', 'for', 'of', 'with', 'as', 'by', 'that', 'this', 
-                               'it', 'from', 'or', 'but', 'are', 'was', 'were', 'be',
-                               'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
-                               'could', 'should', 'may', 'might', 'must', 'can', 'shall'])
+        self.stop_words = STOP_WORDS
     
     def analyze_sentiment(self, text):
         """
-        Analyze sentiment of a single text using TextBlob
+        Analyze sentiment of a single text using VADER
         Returns sentiment polarity and subjectivity
         """
-        blob = TextBlob(text)
-        
         # Get polarity score (-1 to 1)
-        polarity = blob.sentiment.polarity
+        polarity, subjectivity = _cached_sentiment(text)
         
         # Classify sentiment
         if polarity > 0.1:
@@ -44,38 +82,106 @@ class SentimentAnalyzer:
         
         return {
             'polarity': polarity,
-            'subjectivity': blob.sentiment.subjectivity,
+            'subjectivity': subjectivity,
             'sentiment': sentiment
         }
     
     def analyze_comments_batch(self, comments_df):
         """
         Analyze sentiment for a batch of comments
+        Rows line up with comments_df; comment_text is left on the source frame
         """
-        results = []
-        
-        for idx, row in comments_df.iterrows():
-            analysis = self.analyze_sentiment(row['comment_text'])
-            results.append({
-                'comment_id': row['comment_id'],
-                'stakeholder_name': row['stakeholder_name'],
-                'comment_text': row['comment_text'],
-                'provision_reference': row['provision_reference'],
-                'sentiment': analysis['sentiment'],
-                'polarity_score': round(analysis['polarity'], 3),
-                'subjectivity_score': round(analysis['subjectivity'], 3)
-            })
-        
-        return pd.DataFrame(results)
+        texts = comments_df['comment_text'].to_numpy()
+        
+        # Score every comment in one pass instead of building a Series per row,
+        # spreading the work across CPU cores for large batches
+        unique_texts = list(dict.fromkeys(texts))
+        processes = os.cpu_count() or 1
+        if len(unique_texts) < PARALLEL_MIN_COMMENTS or processes < 2:
+            scores = [_score(text) for text in texts]
+        else:
+            # Worker caches are not shared, so send each distinct comment only once
+            with Pool(processes=processes) as pool:
+                unique_scores = pool.map(_score, unique_texts,
+                                         chunksize=max(1, len(unique_texts) // (4 * processes)))
+            score_lookup = dict(zip(unique_texts, unique_scores))
+            scores = [score_lookup[text] for text in texts]
+        
+        polarities = np.array([score[0] for score in scores], dtype=np.float64)
+        subjectivities = np.array([score[1] for score in scores], dtype=np.float32)
+        
+        sentiment_codes, polarities = _classify_and_round(polarities)
+        np.round(subjectivities, 3, out=subjectivities)
+        
+        results = pd.DataFrame({
+            'comment_id': comments_df['comment_id'].to_numpy(),
+            'stakeholder_name': comments_df['stakeholder_name'].to_numpy(),
+            'provision_reference': comments_df['provision_reference'].to_numpy(),
+            'sentiment': pd.Categorical.from_codes(sentiment_codes, categories=SENTIMENT_LABELS),
+            'polarity_score': polarities,
+            'subjectivity_score': subjectivities
+        })
+        
+        # Low-cardinality keys are grouped and counted repeatedly downstream;
+        # categorical codes make those operations work on integers
+        results['provision_reference'] = results['provision_reference'].astype('category')
+        results['stakeholder_name'] = results['stakeholder_name'].astype('category')
+        
+        return results
     
     def get_overall_sentiment(self, sentiments_df):
         """
         Calculate overall sentiment statistics
         """
-        sentiment_counts = sentiments_df['sentiment'].value_counts().to_dict()
-        avg_polarity = sentiments_df['polarity_score'].mean()
+        return self._aggregate(sentiments_df)[0]
+    
+    def extract_keywords(self, text, num_keywords=10):
+        """
+        Extract most frequent keywords from text
+        """
+        stop_words = self.stop_words
+        words = (word.lower() for word in _KEYWORD_RE.findall(text))
+        
+        # Count non-stop-word frequency and return top keywords
+        return Counter(word for word in words if word not in stop_words).most_common(num_keywords)
+    
+    def extract_keywords_batch(self, texts, num_keywords=10):
+        """
+        Extract most frequent keywords across many texts
+        Counts are streamed per text rather than joining everything into one string
+        """
+        stop_words = self.stop_words
+        findall = _KEYWORD_RE.findall
+        keyword_counts = Counter()
+        for text in texts:
+            keyword_counts.update(word for word in map(str.lower, findall(text)) if word not in stop_words)
+        return keyword_counts.most_common(num_keywords)
+    
+    def get_provision_wise_sentiment(self, sentiments_df):
+        """
+        Group sentiments by provision reference
+        """
+        return self._aggregate(sentiments_df)[1]
+    
+    def _aggregate(self, sentiments_df):
+        """
+        Compute overall, provision-wise and stakeholder-wise statistics together
+        Returns (overall_stats, by_provision, by_stakeholder)
+        """
+        total = len(sentiments_df)
+        by_sentiment = sentiments_df.groupby('sentiment', sort=False, observed=True)
+        by_provision = sentiments_df.groupby('provision_reference', sort=False, observed=True)
+        
+        # Per-provision aggregates
+        provision_counts = by_provision.size()
+        provision_polarity = by_provision['polarity_score'].sum()
+        provision_sentiments = by_provision['sentiment'].value_counts()
+        
+        # Overall sentiment statistics
+        sentiment_counts = by_sentiment.size().sort_values(ascending=False, kind='stable').to_dict()
+        # Averaged over every row; the provision groups leave out rows with no provision
+        avg_polarity = float(sentiments_df['polarity_score'].to_numpy().mean(dtype=np.float64))
         
-        # Determine overall sentiment
         if avg_polarity > 0.1:
             overall_sentiment = 'Positive'
         elif avg_polarity < -0.1:
@@ -83,50 +189,34 @@ class SentimentAnalyzer:
         else:
             overall_sentiment = 'Neutral'
         
-        return {
+        overall_stats = {
             'overall_sentiment': overall_sentiment,
             'average_polarity': round(avg_polarity, 3),
             'sentiment_distribution': sentiment_counts,
-            'total_comments': len(sentiments_df),
-            'positive_percentage': round(sentiment_counts.get('Positive', 0) / len(sentiments_df) * 100, 1),
-            'negative_percentage': round(sentiment_counts.get('Negative', 0) / len(sentiments_df) * 100, 1),
-            'neutral_percentage': round(sentiment_counts.get('Neutral', 0) / len(sentiments_df) * 100, 1)
+            'total_comments': total,
+            'positive_percentage': round(sentiment_counts.get('Positive', 0) / total * 100, 1),
+            'negative_percentage': round(sentiment_counts.get('Negative', 0) / total * 100, 1),
+            'neutral_percentage': round(sentiment_counts.get('Neutral', 0) / total * 100, 1)
         }
-    
-    def extract_keywords(self, text, num_keywords=10):
-        """
-        Extract most frequent keywords from text
-        """
-        # Convert to lowercase and remove special characters
-        text = re.sub(r'[^a-zA-Z\s]', '', text.lower())
         
-        # Split into words
-        words = text.split()
-        
-        # Remove stop words and short words
-        keywords = [word for word in words if word not in self.stop_words and len(word) > 3]
-        
-        # Count frequency
-        word_freq = Counter(keywords)
-        
-        # Return top keywords
-        return word_freq.most_common(num_keywords)
-    
-    def get_provision_wise_sentiment(self, sentiments_df):
-        """
-        Group sentiments by provision reference
-        """
+        # Provision-wise sentiment
+        provision_avg = (provision_polarity / provision_counts).round(3)
         provision_sentiment = {}
-        
-        for provision in sentiments_df['provision_reference'].unique():
-            provision_data = sentiments_df[sentiments_df['provision_reference'] == provision]
+        for provision, count in provision_counts.items():
+            sentiments = provision_sentiments[provision]
             provision_sentiment[provision] = {
-                'count': len(provision_data),
-                'avg_polarity': round(provision_data['polarity_score'].mean(), 3),
-                'sentiments': provision_data['sentiment'].value_counts().to_dict()
+                'count': int(count),
+                'avg_polarity': provision_avg[provision],
+                'sentiments': sentiments[sentiments > 0].to_dict()
             }
         
-        return provision_sentiment
+        # Stakeholder-wise sentiment
+        stakeholder_counts = pd.crosstab(sentiments_df['stakeholder_name'], sentiments_df['sentiment'])
+        stakeholder_counts = stakeholder_counts.reindex(columns=SENTIMENT_LABELS, fill_value=0)
+        stakeholder_counts['total'] = stakeholder_counts.sum(axis=1)
+        stakeholder_sentiment = stakeholder_counts.rename(columns=str.lower).to_dict(orient='index')
+        
+        return overall_stats, provision_sentiment, stakeholder_sentiment
     
     def analyze(self, df):
         """
@@ -136,27 +226,11 @@ class SentimentAnalyzer:
         # Perform batch sentiment analysis
         detailed_results = self.analyze_comments_batch(df)
         
-        # Get overall sentiment statistics
-        overall_stats = self.get_overall_sentiment(detailed_results)
-        
-        # Get provision-wise sentiment
-        provision_sentiment = self.get_provision_wise_sentiment(detailed_results)
-        
-        # Get stakeholder-wise sentiment
-        stakeholder_sentiment = {}
-        for stakeholder in detailed_results['stakeholder_name'].unique():
-            stakeholder_data = detailed_results[detailed_results['stakeholder_name'] == stakeholder]
-            stakeholder_sentiment[stakeholder] = {
-                'positive': len(stakeholder_data[stakeholder_data['sentiment'] == 'Positive']),
-                'negative': len(stakeholder_data[stakeholder_data['sentiment'] == 'Negative']),
-                'neutral': len(stakeholder_data[stakeholder_data['sentiment'] == 'Neutral']),
-                'total': len(stakeholder_data)
-            }
+        # Get overall, provision-wise and stakeholder-wise sentiment
+        overall_stats, provision_sentiment, stakeholder_sentiment = self._aggregate(detailed_results)
         
-        # Convert sentiment distribution keys to lowercase for consistency
-        sentiment_summary = {}
-        for key, value in overall_stats['sentiment_distribution'].items():
-            sentiment_summary[key.lower()] = value
+        # Lowercase view of the distribution for the app; overall_stats keeps the original
+        sentiment_summary = {key.lower(): value for key, value in overall_stats['sentiment_distribution'].items()}
         
         return {
             'summary': sentiment_summary,
@@ -6,6 +6,7 @@ Streamlit Web Application
 import streamlit as st
 import pandas as pd
 import os
+import hashlib
 from datetime import datetime
 import tempfile
 import plotly.graph_objs as go
@@ -13,28 +14,8 @@ import plotly.express as px
 from io import BytesIO
 import base64
 
-# Download required NLTK data at startup
-import nltk
-import ssl
-
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-# Download required NLTK data
-for corpus in ['punkt', 'brown', 'stopwords', 'averaged_perceptron_tagger', 'punkt_tab']:
-    try:
-        nltk.download(corpus, quiet=True)
-    except:
-        pass
-
-# Import our modules
-from sentiment_analyzer import SentimentAnalyzer
-from text_summarizer import TextSummarizer
-from wordcloud_generator import WordCloudGenerator
+# Chart colours for each sentiment class
+SENTIMENT_COLORS = {'Positive': '#10b981', 'Negative': '#ef4444', 'Neutral': '#6b7280'}
 
 # Page configuration
 st.set_page_config(
@@ -44,16 +25,25 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize analyzers
+# Initialize analyzers lazily, each on first use, so the page renders
+# before the heavier summarization and word cloud modules are imported
 @st.cache_resource
-def load_analyzers():
-    """Load and cache the analysis models"""
-    sentiment_analyzer = SentimentAnalyzer()
-    text_summarizer = TextSummarizer()
-    wordcloud_generator = WordCloudGenerator()
-    return sentiment_analyzer, text_summarizer, wordcloud_generator
+def get_sentiment_analyzer():
+    """Load and cache the sentiment analyzer"""
+    from sentiment_analyzer import SentimentAnalyzer
+    return SentimentAnalyzer()
 
-sentiment_analyzer, text_summarizer, wordcloud_generator = load_analyzers()
+@st.cache_resource
+def get_text_summarizer():
+    """Load and cache the text summarizer"""
+    from text_summarizer import TextSummarizer
+    return TextSummarizer()
+
+@st.cache_resource
+def get_wordcloud_generator():
+    """Load and cache the word cloud generator"""
+    from wordcloud_generator import WordCloudGenerator
+    return WordCloudGenerator()
 
 # Custom CSS
 st.markdown("""
@@ -89,45 +79,89 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def perform_analysis(df):
-    """Main analysis function"""
+def mean_text_length(texts):
+    """Average character length of a text column, computed on its underlying buffer"""
+    if isinstance(texts.dtype, pd.ArrowDtype):
+        # Arrow-backed uploads: measure lengths in Arrow without converting to Python strings
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        return pc.mean(pc.utf8_length(pa.array(texts.array))).as_py()
+    return texts.str.len().to_numpy().mean()
+
+def hash_dataframe(df):
+    """Hash a DataFrame by content so re-uploads of the same data hit the cache"""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).digest()
+
+# Results hold detailed frames and word cloud images, so keep only a few recent uploads
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600, hash_funcs={pd.DataFrame: hash_dataframe})
+def _cached_analysis(df):
+    """Run the analysis pipeline, cached on the contents of the uploaded data"""
     results = {}
     
     with st.spinner("Performing sentiment analysis..."):
         # 1. Sentiment Analysis
-        sentiment_results = sentiment_analyzer.analyze(df)
+        sentiment_results = get_sentiment_analyzer().analyze(df)
+        # The same detailed frame is shared, never copied, by every later stage
+        detailed = sentiment_results['detailed']
         results['sentiment_summary'] = sentiment_results['summary']
-        results['detailed'] = sentiment_results['detailed']  # Fixed: using consistent key
+        results['detailed'] = detailed  # Fixed: using consistent key
         results['sentiment_by_provision'] = sentiment_results['by_provision']
         results['sentiment_by_stakeholder'] = sentiment_results['by_stakeholder']
     
     with st.spinner("Generating text summaries..."):
-        # 2. Text Summarization
-        summary_results = text_summarizer.summarize(df, sentiment_results['detailed'])
+        # 2. Text Summarization; word counts are built once and shared with the word clouds
+        from corpus_stats import prepare_corpus_stats
+        stats = prepare_corpus_stats(df, detailed)
+        summary_results = get_text_summarizer().summarize(df, detailed, stats)
         results['overall_summary'] = summary_results['overall_summary']
         results['key_themes'] = summary_results['key_themes']
         results['provision_summaries'] = summary_results['provision_summaries']
     
     with st.spinner("Creating word clouds..."):
-        # 3. Word Cloud Generation
-        wordcloud_results = wordcloud_generator.generate(df, sentiment_results['detailed'])
+        # 3. Word Cloud Generation (st.image takes PNG bytes, so skip base64)
+        wordcloud_results = get_wordcloud_generator().generate(df, detailed, stats, return_bytes=True)
         results['main_wordcloud'] = wordcloud_results['main_wordcloud']
         results['sentiment_wordclouds'] = wordcloud_results['sentiment_wordclouds']
     
-    with st.spinner("Creating visualizations..."):
-        # 4. Create charts
-        results['charts'] = create_charts(results)
-    
-    # 5. Statistical summary
+    # 4. Statistical summary
     results['statistics'] = {
         'total_comments': len(df),
         'unique_stakeholders': df['stakeholder_name'].nunique(),
         'provisions_discussed': df['provision_reference'].nunique(),
-        'avg_comment_length': df['comment_text'].str.len().mean()
+        'avg_comment_length': mean_text_length(df['comment_text'])
     }
     
     return results
 
+def perform_analysis(df):
+    """Main analysis function"""
+    results = _cached_analysis(df)
+    
+    with st.spinner("Creating visualizations..."):
+        # 5. Create charts (Plotly figures are rebuilt rather than cached)
+        results['charts'] = create_charts(results)
+    
+    return results
+
+def create_sentiment_bar(counts_df, axis_title):
+    """Build a stacked sentiment bar chart from per-sentiment count columns"""
+    long_df = (counts_df
+               .reindex(columns=['positive', 'negative', 'neutral'], fill_value=0)
+               .fillna(0)
+               .rename(columns=str.capitalize)
+               .rename_axis(axis_title)
+               .reset_index()
+               .melt(id_vars=axis_title, var_name='Sentiment', value_name='Number of Comments'))
+    return px.bar(
+        long_df,
+        x=axis_title,
+        y='Number of Comments',
+        color='Sentiment',
+        color_discrete_map=SENTIMENT_COLORS,
+        barmode='stack'
+    )
+
 def create_charts(results):
     """Create Plotly charts for visualization"""
     charts = {}
@@ -147,22 +181,13 @@ def create_charts(results):
     charts['sentiment_pie'] = fig_pie
     
     # 2. Sentiment by provision
-    provision_df = pd.DataFrame(results['sentiment_by_provision']).T
+    provision_df = pd.DataFrame({
+        provision: data['sentiments'] for provision, data in results['sentiment_by_provision'].items()
+    }).T.rename(columns=str.lower)
     if not provision_df.empty:
-        fig_bar = go.Figure()
-        for sentiment in ['positive', 'negative', 'neutral']:
-            if sentiment in provision_df.columns:
-                fig_bar.add_trace(go.Bar(
-                    name=sentiment.capitalize(),
-                    x=provision_df.index,
-                    y=provision_df[sentiment],
-                    marker_color={'positive': '#10b981', 'negative': '#ef4444', 'neutral': '#6b7280'}[sentiment]
-                ))
+        fig_bar = create_sentiment_bar(provision_df, "Provision")
         fig_bar.update_layout(
             title="Sentiment Distribution by Provision",
-            xaxis_title="Provision",
-            yaxis_title="Number of Comments",
-            barmode='stack',
             height=400
         )
         charts['provision_bar'] = fig_bar
@@ -170,23 +195,11 @@ def create_charts(results):
     # 3. Top stakeholders
     stakeholder_df = pd.DataFrame(results['sentiment_by_stakeholder']).T
     if not stakeholder_df.empty:
-        stakeholder_df['total'] = stakeholder_df.sum(axis=1)
         top_stakeholders = stakeholder_df.nlargest(10, 'total')
         
-        fig_stakeholder = go.Figure()
-        for sentiment in ['positive', 'negative', 'neutral']:
-            if sentiment in top_stakeholders.columns and sentiment != 'total':
-                fig_stakeholder.add_trace(go.Bar(
-                    name=sentiment.capitalize(),
-                    x=top_stakeholders.index,
-                    y=top_stakeholders[sentiment],
-                    marker_color={'positive': '#10b981', 'negative': '#ef4444', 'neutral': '#6b7280'}[sentiment]
-                ))
+        fig_stakeholder = create_sentiment_bar(top_stakeholders, "Stakeholder")
         fig_stakeholder.update_layout(
             title="Top 10 Most Active Stakeholders",
-            xaxis_title="Stakeholder",
-            yaxis_title="Number of Comments",
-            barmode='stack',
             height=400,
             xaxis_tickangle=-45
         )
@@ -194,7 +207,7 @@ def create_charts(results):
     
     return charts
 
-def display_results(results):
+def display_results(results, df):
     """Display analysis results in Streamlit"""
     
     # Header metrics
@@ -267,7 +280,7 @@ def display_results(results):
         # Main word cloud
         st.subheader("Overall Word Cloud")
         if results['main_wordcloud']:
-            st.image(f"data:image/png;base64,{results['main_wordcloud']}", use_column_width=True)
+            st.image(results['main_wordcloud'], use_column_width=True)
         
         # Sentiment word clouds
         st.subheader("Word Clouds by Sentiment")
@@ -278,25 +291,46 @@ def display_results(results):
                 if sentiment in results['sentiment_wordclouds']:
                     with cols[i]:
                         st.write(f"**{sentiment.capitalize()}**")
-                        st.image(f"data:image/png;base64,{results['sentiment_wordclouds'][sentiment]}", use_column_width=True)
+                        st.image(results['sentiment_wordclouds'][sentiment], use_column_width=True)
     
     with tab5:
         st.header("Detailed Data Tables")
         
         # Detailed sentiments table
         st.subheader("Comment-level Sentiment Analysis")
-        detailed_df = results['detailed']  # Fixed: using correct key
+        # Comment text lives on the uploaded frame; attach it only for display
+        detailed_df = results['detailed'].copy(deep=False)  # Fixed: using correct key
+        if len(df) == len(detailed_df):
+            detailed_df.insert(2, 'comment_text', df['comment_text'].to_numpy())
         st.dataframe(detailed_df, use_container_width=True)
         
         # Download options
-        csv = detailed_df.to_csv(index=False).encode('utf-8')
+        # Write straight to bytes instead of building a str and re-encoding it
+        csv_buffer = BytesIO()
+        detailed_df.to_csv(csv_buffer, index=False, encoding='utf-8')
         st.download_button(
             label="Download Detailed Results as CSV",
-            data=csv,
+            data=csv_buffer.getvalue(),
             file_name=f"sentiment_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
             mime='text/csv'
         )
 
+def read_uploaded_file(uploaded_file):
+    """Read an uploaded CSV or Excel file with the fastest available engine"""
+    if uploaded_file.name.endswith('.csv'):
+        try:
+            return pd.read_csv(uploaded_file, engine='pyarrow', dtype_backend='pyarrow')
+        except ImportError:
+            uploaded_file.seek(0)
+            return pd.read_csv(uploaded_file)
+    
+    try:
+        return pd.read_excel(uploaded_file, engine='calamine')
+    except (ImportError, ValueError):
+        # calamine needs pandas 2.2+ and python-calamine; fall back to openpyxl
+        uploaded_file.seek(0)
+        return pd.read_excel(uploaded_file)
+
 def main():
     """Main Streamlit application"""
     
@@ -331,6 +365,8 @@ def main():
                 # Load the sample_data.csv file
                 sample_data = pd.read_csv('sample_data.csv')
                 st.session_state['uploaded_data'] = sample_data
+                # Results from a previous dataset no longer apply
+                st.session_state.pop('analysis_results', None)
                 st.success(f"Sample data loaded! ({len(sample_data)} comments)")
                 st.rerun()
             except FileNotFoundError:
@@ -348,6 +384,7 @@ def main():
                     'provision_reference': ['Section 2.1', 'Section 3.2', 'Section 2.1', 'Section 3.2', 'Section 4.1']
                 })
                 st.session_state['uploaded_data'] = sample_data
+                st.session_state.pop('analysis_results', None)
                 st.success("Sample data loaded!")
                 st.rerun()
     
@@ -365,10 +402,7 @@ def main():
         if uploaded_file is not None:
             try:
                 # Read the file
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
+                df = read_uploaded_file(uploaded_file)
                 
                 # Validate columns
                 required_columns = ['comment_id', 'stakeholder_name', 'comment_text', 'provision_reference']
@@ -380,6 +414,7 @@ def main():
                 
                 # Clean data
                 df = df.dropna(subset=['comment_text'])
+                df = df.astype({'stakeholder_name': 'category', 'provision_reference': 'category'})
                 
                 if len(df) == 0:
                     st.error("No valid comments found in the file")
@@ -416,7 +451,7 @@ def main():
                 st.session_state['analysis_results'] = results
         
         # Display results
-        display_results(st.session_state['analysis_results'])
+        display_results(st.session_state['analysis_results'], df)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,124 @@
+"""
+Tests for the analysis pipeline on the bundled sample data
+"""
+
+import os
+import pandas as pd
+import pytest
+import sentiment_analyzer
+from sentiment_analyzer import SentimentAnalyzer
+from text_summarizer import TextSummarizer
+from wordcloud_generator import WordCloudGenerator
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_data.csv')
+
+@pytest.fixture(scope='module')
+def comments_df():
+    return pd.read_csv(SAMPLE_DATA)
+
+@pytest.fixture(scope='module')
+def sentiments_df(comments_df):
+    return SentimentAnalyzer().analyze(comments_df)['detailed']
+
+@pytest.fixture
+def short_replies_df():
+    """
+    Comments whose words are all too short to count, so every word bucket is empty
+    """
+    return pd.DataFrame({
+        'comment_id': [1, 2],
+        'stakeholder_name': ['Individual Citizen', 'Business Owner'],
+        'comment_text': ['N/A', 'No.'],
+        'provision_reference': ['Section 1.1', 'Section 1.1']
+    })
+
+def test_analyze_sample_data(comments_df):
+    results = SentimentAnalyzer().analyze(comments_df)
+    detailed = results['detailed']
+    
+    assert len(detailed) == len(comments_df)
+    assert results['summary'] == {'positive': 7, 'negative': 2, 'neutral': 1}
+    assert results['overall_stats']['overall_sentiment'] == 'Positive'
+    assert results['overall_stats']['total_comments'] == len(comments_df)
+    assert isinstance(results['overall_stats']['average_polarity'], float)
+    
+    # Rows line up with the input comments
+    assert detailed['comment_id'].tolist() == comments_df['comment_id'].tolist()
+    assert list(detailed['sentiment'].cat.categories) == sentiment_analyzer.SENTIMENT_LABELS
+    assert detailed['polarity_score'].dtype == 'float32'
+    assert detailed['polarity_score'].between(-1, 1).all()
+
+def test_analyze_parallel_matches_serial(comments_df, monkeypatch):
+    serial = SentimentAnalyzer().analyze_comments_batch(comments_df)
+    
+    monkeypatch.setattr(sentiment_analyzer, 'PARALLEL_MIN_COMMENTS', 1)
+    monkeypatch.setattr(sentiment_analyzer.os, 'cpu_count', lambda: 2)
+    parallel = SentimentAnalyzer().analyze_comments_batch(comments_df)
+    
+    pd.testing.assert_frame_equal(serial, parallel)
+
+def test_analyze_sentiment_labels():
+    analyzer = SentimentAnalyzer()
+    
+    assert analyzer.analyze_sentiment('This is an excellent and very helpful reform.')['sentiment'] == 'Positive'
+    assert analyzer.analyze_sentiment('This is a terrible, harmful and unfair burden.')['sentiment'] == 'Negative'
+    assert analyzer.analyze_sentiment('Section 4.1 covers filing dates.')['sentiment'] == 'Neutral'
+
+def test_summarize_sample_data(comments_df, sentiments_df):
+    results = TextSummarizer().summarize(comments_df, sentiments_df)
+    
+    assert set(results) == {'overall_summary', 'key_themes', 'provision_summaries', 'stakeholder_groups'}
+    assert results['overall_summary'].startswith(f'Analysis of {len(comments_df)} stakeholder comments')
+    assert set(results['provision_summaries']) == set(comments_df['provision_reference'])
+    assert all(results['provision_summaries'].values())
+    assert 0 < len(results['key_themes']) <= 10
+    
+    groups = results['stakeholder_groups']
+    assert sum(group['count'] for group in groups.values()) == len(comments_df)
+    assert all(type(group['average_polarity']) is float for group in groups.values())
+
+def test_summarize_short_replies(short_replies_df):
+    sentiments = SentimentAnalyzer().analyze(short_replies_df)['detailed']
+    results = TextSummarizer().summarize(short_replies_df, sentiments)
+    
+    assert results['key_themes'] == []
+    assert results['provision_summaries'] == {'Section 1.1': 'N/A No.'}
+
+def test_generate_sample_data(comments_df, sentiments_df):
+    results = WordCloudGenerator().generate(comments_df, sentiments_df, return_bytes=True)
+    
+    assert results['main_wordcloud'].startswith(b'\x89PNG')
+    assert set(results['sentiment_wordclouds']) == {'positive', 'negative', 'neutral'}
+    assert len(results['provision_wordclouds']) == 3
+    assert all(png.startswith(b'\x89PNG') for png in results['provision_wordclouds'].values())
+    assert len(results['frequency_data']['words']) == len(results['frequency_data']['frequencies']) > 0
+
+def test_generate_base64_by_default(comments_df, sentiments_df):
+    results = WordCloudGenerator().generate(comments_df, sentiments_df)
+    
+    assert isinstance(results['main_wordcloud'], str)
+
+def test_generate_short_replies(short_replies_df):
+    sentiments = SentimentAnalyzer().analyze(short_replies_df)['detailed']
+    generator = WordCloudGenerator()
+    results = generator.generate(short_replies_df, sentiments)
+    
+    # No cloud has a word to plot, so none is rendered rather than raising
+    assert results['main_wordcloud'] is None
+    assert results['sentiment_wordclouds'] == {}
+    assert results['provision_wordclouds'] == {}
+    assert results['frequency_data'] == {'words': [], 'frequencies': []}
+    assert generator.generate_sentiment_wordclouds(short_replies_df, sentiments) == {}
+
+def test_generate_skips_empty_sentiment(comments_df, sentiments_df, short_replies_df):
+    # The short replies are the only Neutral comments once the sample's Neutral one is left out
+    keep = sentiments_df['sentiment'] != 'Neutral'
+    sample = comments_df[keep.to_numpy()]
+    combined = pd.concat([sample, short_replies_df], ignore_index=True)
+    sentiments = SentimentAnalyzer().analyze(combined)['detailed']
+    assert (sentiments['sentiment'] == 'Neutral').sum() == len(short_replies_df)
+    
+    results = WordCloudGenerator().generate(combined, sentiments)
+    
+    assert set(results['sentiment_wordclouds']) == {'positive', 'negative'}
+    assert 'Section 1.1' not in results['provision_wordclouds']
@@ -2,20 +2,62 @@
 Text Summarization Module for E-consultation Comments
 """
 
-import re
+import os
+from multiprocessing import Pool
 from collections import Counter
-import pandas as pd
-from textblob import TextBlob
+from heapq import nlargest
+import numpy as np
+from sentiment_analyzer import STOP_WORDS
+from corpus_stats import prepare_corpus_stats, tokenize
+
+# Meaningful policy words (nouns, verbs, adjectives) reported as sentiment keywords
+SENTIMENT_KEYWORDS = frozenset(['compliance', 'regulation', 'business', 'cost', 'implementation',
+                                'transparency', 'governance', 'reform', 'burden', 'support',
+                                'accountability', 'framework', 'amendment', 'provision',
+                                'requirement', 'documentation', 'innovation', 'growth'])
+
+# Below this much combined provision text, pickling texts and word counts to worker
+# processes costs more than summarizing serially
+PARALLEL_MIN_TEXT_LENGTH = 20_000_000
+
+def _score_sentences(sentences, word_freq):
+    """
+    Return {sentence: mean word frequency} for the non-empty, stripped sentences
+    Word weights are looked up into one flat array and summed per sentence with
+    np.add.reduceat, rather than with a Python sum per sentence
+    """
+    # Repeated sentences keep their first position, as with a plain dict
+    unique_sentences = list(dict.fromkeys(sentence for sentence in map(str.strip, sentences) if sentence))
+    if not unique_sentences:
+        return {}
+    
+    sentence_words = [sentence.lower().split() for sentence in unique_sentences]
+    lengths = np.fromiter(map(len, sentence_words), dtype=np.int64, count=len(sentence_words))
+    get = word_freq.get
+    weights = np.fromiter((get(word, 0) for words in sentence_words for word in words),
+                          dtype=np.float64, count=int(lengths.sum()))
+    
+    # Every stripped, non-empty sentence has at least one word, so no segment is empty
+    starts = np.cumsum(lengths) - lengths
+    scores = np.add.reduceat(weights, starts) / lengths
+    
+    return dict(zip(unique_sentences, scores.tolist()))
+
+def _summarize_provision(args):
+    """
+    Summarize one provision's combined text; module-level so Pool can pickle it
+    """
+    text, word_freq = args
+    return TextSummarizer().summarize_single_comment(text, max_length=100, word_freq=word_freq)
 
 class TextSummarizer:
     def __init__(self):
-        self.stop_words = set(['the', 'is', 'at', 'which', 'on', 'and', 'a', 'an', 'in', 
-                               'to', 'for', 'of', 'with', 'as', 'by', 'that', 'this', 
-                               'it', 'from', 'or', 'but', 'are', 'was', 'were', 'be'])
+        self.stop_words = STOP_WORDS
     
-    def summarize_single_comment(self, text, max_length=50):
+    def summarize_single_comment(self, text, max_length=50, word_freq=None):
         """
         Create a brief summary of a single comment
+        word_freq can pass in precomputed word counts for text to skip re-tokenizing it
         """
         # If text is already short, return as is
         words = text.split()
@@ -28,20 +70,15 @@ class TextSummarizer:
             # For very short texts, just truncate
             return ' '.join(words[:max_length]) + '...'
         
-        # Score sentences based on word frequency
-        word_freq = self._get_word_frequency(text)
-        sentence_scores = {}
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if len(sentence) > 0:
-                words_in_sentence = sentence.lower().split()
-                score = sum(word_freq.get(word, 0) for word in words_in_sentence)
-                sentence_scores[sentence] = score / len(words_in_sentence) if words_in_sentence else 0
+        # Score sentences based on word frequency; only relative weights matter here
+        if word_freq is None:
+            word_freq = self._get_word_frequency(text)
+        sentence_scores = _score_sentences(sentences, word_freq)
         
-        # Get top sentences
-        top_sentences = sorted(sentence_scores.items(), key=lambda x: x[1], reverse=True)[:2]
-        summary = '. '.join([sent[0] for sent in top_sentences])
+        # Get top sentences, then put them back in the order they appear in the text
+        scored = list(sentence_scores.items())
+        top_positions = sorted(nlargest(2, range(len(scored)), key=lambda position: scored[position][1]))
+        summary = '. '.join([scored[position][0] for position in top_positions])
         
         # Ensure summary is not too long
         summary_words = summary.split()
@@ -50,41 +87,51 @@ class TextSummarizer:
         
         return summary
     
+    def _tokenize(self, text):
+        """
+        Clean text and return its non-stop-word tokens
+        """
+        return tokenize(text, self.stop_words)
+    
     def _get_word_frequency(self, text):
         """
         Calculate word frequency for text
         """
-        # Clean text
-        text = re.sub(r'[^a-zA-Z\s]', '', text.lower())
-        words = [word for word in text.split() if word not in self.stop_words and len(word) > 2]
-        
-        # Calculate frequency
-        word_freq = Counter(words)
+        # Calculate frequency, most common word first
+        items = Counter(self._tokenize(text)).most_common()
+        if not items:
+            return {}
         
-        # Normalize frequencies
-        max_freq = max(word_freq.values()) if word_freq else 1
-        for word in word_freq:
-            word_freq[word] = word_freq[word] / max_freq
+        # Normalize frequencies in one vectorized divide by the top count
+        words, counts = zip(*items)
+        frequencies = np.array(counts, dtype=np.float64)
+        frequencies /= frequencies[0]
         
-        return word_freq
+        return dict(zip(words, frequencies.tolist()))
     
-    def generate_overall_summary(self, comments_df, sentiments_df):
+    def generate_overall_summary(self, comments_df, sentiments_df, stats=None):
         """
         Generate an overall summary of all comments
+        stats is a CorpusStats for the comments, reused when the caller already has it
         """
+        if stats is None:
+            stats = prepare_corpus_stats(comments_df, sentiments_df)
+        global_counter = stats.global_counter
+        per_sentiment_counter = stats.per_sentiment_counter
+        
         total_comments = len(comments_df)
         
-        # Get sentiment distribution
+        # Get sentiment distribution (categorical columns also count unused classes)
         sentiment_counts = sentiments_df['sentiment'].value_counts()
+        sentiment_counts = sentiment_counts[sentiment_counts > 0]
         
         # Find most discussed provisions
         provision_counts = comments_df['provision_reference'].value_counts()
+        provision_counts = provision_counts[provision_counts > 0]
         top_provisions = provision_counts.head(3).to_dict()
         
         # Extract key themes
-        all_text = ' '.join(comments_df['comment_text'].tolist())
-        word_freq = self._get_word_frequency(all_text)
-        top_themes = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:5]
+        top_themes = global_counter.most_common(5)
         top_theme_words = [theme[0] for theme in top_themes]
         
         # Generate summary
@@ -106,45 +153,29 @@ class TextSummarizer:
         summary += f"• Main topics: {', '.join(top_theme_words)}\n"
         
         # Key insights based on sentiment
-        positive_comments = sentiments_df[sentiments_df['sentiment'] == 'Positive']
-        negative_comments = sentiments_df[sentiments_df['sentiment'] == 'Negative']
-        
-        if len(positive_comments) > 0:
+        if 'Positive' in per_sentiment_counter:
             summary += "\nPOSITIVE FEEDBACK:\n"
             # Get common positive words
-            positive_text = ' '.join(positive_comments['comment_text'].tolist())
-            positive_keywords = self._extract_sentiment_keywords(positive_text, 3)
+            positive_keywords = self._extract_sentiment_keywords(per_sentiment_counter['Positive'], 3)
             summary += f"• Stakeholders appreciate: {', '.join(positive_keywords)}\n"
         
-        if len(negative_comments) > 0:
+        if 'Negative' in per_sentiment_counter:
             summary += "\nCONCERNS RAISED:\n"
             # Get common negative words
-            negative_text = ' '.join(negative_comments['comment_text'].tolist())
-            negative_keywords = self._extract_sentiment_keywords(negative_text, 3)
+            negative_keywords = self._extract_sentiment_keywords(per_sentiment_counter['Negative'], 3)
             summary += f"• Main concerns: {', '.join(negative_keywords)}\n"
         
         return summary
     
-    def _extract_sentiment_keywords(self, text, num_keywords=5):
+    def _extract_sentiment_keywords(self, word_counts, num_keywords=5):
         """
-        Extract keywords specific to sentiment
+        Extract keywords specific to sentiment from a Counter of comment tokens
         """
-        # Clean and tokenize
-        text = re.sub(r'[^a-zA-Z\s]', '', text.lower())
-        words = [word for word in text.split() if word not in self.stop_words and len(word) > 3]
-        
-        # Filter for meaningful words (nouns, verbs, adjectives)
-        meaningful_words = []
-        for word in words:
-            if word in ['compliance', 'regulation', 'business', 'cost', 'implementation', 
-                       'transparency', 'governance', 'reform', 'burden', 'support', 
-                       'accountability', 'framework', 'amendment', 'provision', 
-                       'requirement', 'documentation', 'innovation', 'growth']:
-                meaningful_words.append(word)
+        # Keep only the meaningful policy words
+        meaningful_words = Counter({word: count for word, count in word_counts.items() if word in SENTIMENT_KEYWORDS})
         
         # Get most common
-        word_freq = Counter(meaningful_words)
-        top_words = word_freq.most_common(num_keywords)
+        top_words = meaningful_words.most_common(num_keywords)
         
         return [word[0] for word in top_words]
     
@@ -152,66 +183,67 @@ class TextSummarizer:
         """
         Create a summary grouped by stakeholder type
         """
-        # Group stakeholders by patterns in their names
-        stakeholder_groups = {
-            'Business': [],
-            'Legal': [],
-            'Government': [],
-            'Individual': [],
-            'Association': []
-        }
+        # Group stakeholders by patterns in their names; earlier patterns take priority
+        names = comments_df['stakeholder_name'].str.lower()
+        group_patterns = [
+            ('Legal', 'firm|legal|lawyer'),
+            ('Business', 'business|company|ceo|founder'),
+            ('Government', 'ministry|government'),
+            ('Association', 'association|chamber|group|org')
+        ]
+        groups = np.select(
+            [names.str.contains(pattern, na=False).to_numpy() for _, pattern in group_patterns],
+            [group for group, _ in group_patterns],
+            default='Individual'
+        )
         
-        for idx, row in comments_df.iterrows():
-            name = row['stakeholder_name'].lower()
-            sentiment_row = sentiments_df[sentiments_df['comment_id'] == row['comment_id']].iloc[0]
-            
-            if 'firm' in name or 'legal' in name or 'lawyer' in name:
-                stakeholder_groups['Legal'].append(sentiment_row)
-            elif 'business' in name or 'company' in name or 'ceo' in name or 'founder' in name:
-                stakeholder_groups['Business'].append(sentiment_row)
-            elif 'ministry' in name or 'government' in name:
-                stakeholder_groups['Government'].append(sentiment_row)
-            elif 'association' in name or 'chamber' in name or 'group' in name or 'org' in name:
-                stakeholder_groups['Association'].append(sentiment_row)
-            else:
-                stakeholder_groups['Individual'].append(sentiment_row)
+        # Sentiment rows line up with comment rows, so the labels apply positionally
+        grouped = sentiments_df.groupby(groups, sort=False)
+        group_counts = grouped.size()
+        group_polarity = grouped['polarity_score'].mean()
+        group_sentiments = grouped['sentiment'].value_counts()
         
         # Create summary for each group
         group_summary = {}
-        for group, comments in stakeholder_groups.items():
-            if comments:
-                comments_df_group = pd.DataFrame(comments)
-                sentiment_dist = comments_df_group['sentiment'].value_counts().to_dict()
-                avg_polarity = comments_df_group['polarity_score'].mean()
-                
+        for group in ['Business', 'Legal', 'Government', 'Individual', 'Association']:
+            if group in group_counts.index:
+                sentiment_dist = group_sentiments[group]
                 group_summary[group] = {
-                    'count': len(comments),
-                    'sentiment_distribution': sentiment_dist,
-                    'average_polarity': round(avg_polarity, 3)
+                    'count': int(group_counts[group]),
+                    'sentiment_distribution': sentiment_dist[sentiment_dist > 0].to_dict(),
+                    'average_polarity': float(round(group_polarity[group], 3))
                 }
         
         return group_summary
     
-    def summarize(self, df, sentiments_df):
+    def summarize(self, df, sentiments_df, stats=None):
         """
         Main summarization method that combines all text summarization functions
         Returns a dictionary with overall summary, key themes, and provision summaries
+        stats can pass in a CorpusStats shared with the word cloud generator
         """
+        # Tokenize and count words once for every stage below
+        if stats is None:
+            stats = prepare_corpus_stats(df, sentiments_df)
+        
         # Generate overall summary
-        overall_summary = self.generate_overall_summary(df, sentiments_df)
+        overall_summary = self.generate_overall_summary(df, sentiments_df, stats)
         
         # Extract key themes
-        all_text = ' '.join(df['comment_text'].tolist())
-        word_freq = self._get_word_frequency(all_text)
-        top_themes = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:10]
+        top_themes = stats.global_counter.most_common(10)
         key_themes = [theme[0] for theme in top_themes]
         
-        # Generate provision-wise summaries
-        provision_summaries = {}
-        for provision in df['provision_reference'].unique():
-            provision_comments = df[df['provision_reference'] == provision]
-            provision_text = ' '.join(provision_comments['comment_text'].tolist())
-            provision_summaries[provision] = self.summarize_single_comment(provision_text, max_length=100)
+        # Generate provision-wise summaries; each provision is independent,
+        # so very large consultations spread them across CPU cores
+        provision_texts = stats.provision_texts
+        tasks = [(text, stats.per_provision_counter[provision]) for provision, text in provision_texts.items()]
+        workers = min(len(tasks), os.cpu_count() or 1)
+        if workers < 2 or sum(len(text) for text, _ in tasks) < PARALLEL_MIN_TEXT_LENGTH:
+            summaries = [_summarize_provision(task) for task in tasks]
+        else:
+            with Pool(processes=workers) as pool:
+                summaries = pool.map(_summarize_provision, tasks)
+        provision_summaries = dict(zip(provision_texts, summaries))
         
         # Get stakeholder group summary
         stakeholder_summary = self.create_stakeholder_summary(df, sentiments_df)
@@ -2,183 +2,245 @@
 Word Cloud Generation Module for E-consultation Comments
 """
 
+import os
 import base64
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 from wordcloud import WordCloud
-import matplotlib
-matplotlib.use('Agg')  # Use non-GUI backend for web deployment
-import matplotlib.pyplot as plt
+from PIL import Image, ImageDraw, ImageFont
 import pandas as pd
-import re
 from collections import Counter
+from functools import lru_cache
+from dataclasses import replace
+from sentiment_analyzer import PARALLEL_MIN_COMMENTS, STOP_WORDS
+from corpus_stats import prepare_corpus_stats, tokenize
+
+# Word clouds also drop pronouns and filler words that crowd out the real topics
+WORDCLOUD_STOP_WORDS = STOP_WORDS | frozenset(['we', 'our', 'us', 'them', 'they', 'their', 'these', 'those',
+                                               'been', 'being', 'having', 'more', 'very', 'some', 'any'])
+
+# WordCloud settings shared by every cloud; counts are already filtered, so no stop words
+WORDCLOUD_OPTIONS = {
+    'background_color': 'white',
+    'stopwords': frozenset(),
+    'relative_scaling': 0.5
+}
+
+# Colour scheme for each sentiment's word cloud
+SENTIMENT_COLORMAPS = [('Positive', 'Greens'), ('Negative', 'Reds'), ('Neutral', 'Blues')]
+
+@lru_cache(maxsize=None)
+def _title_font(font_size):
+    """
+    Load the title font once per size instead of once per cloud
+    """
+    return ImageFont.load_default(size=font_size)
+
+def _encode_png(wordcloud, title, font_size):
+    """
+    Render a word cloud with a centred title strip and return it as PNG bytes
+    The image is written straight from PIL; going through a Matplotlib figure
+    only resampled the already rasterized cloud
+    """
+    cloud = wordcloud.to_image()
+    font = _title_font(font_size)
+    padding = font_size * 5 // 8
+    header = font_size + 2 * padding
+    
+    image = Image.new('RGB', (cloud.width, cloud.height + header), 'white')
+    image.paste(cloud, (0, header))
+    draw = ImageDraw.Draw(image)
+    draw.text(((cloud.width - draw.textlength(title, font=font)) / 2, padding), title, fill='black', font=font)
+    
+    # PNGs are encoded per request, so use a fast zlib level
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+def _png_output(png, return_bytes):
+    """
+    Return PNG bytes as they are, or as base64 text for embedding in web pages
+    """
+    return png if return_bytes else base64.b64encode(png).decode()
+
+def _top_frequencies(word_counts, max_words):
+    """
+    Keep the most frequent words of a Counter, with headroom for words that do not fit the canvas
+    """
+    return dict(word_counts.most_common(max_words * 3))
+
+def _render_cloud(word_counts, colormap, title, max_words, width=800, height=400, font_size=16):
+    """
+    Generate a titled word cloud from precomputed word counts and return it as PNG bytes
+    Module-level so clouds can be rendered in worker processes
+    """
+    wordcloud = WordCloud(
+        width=width,
+        height=height,
+        max_words=max_words,
+        colormap=colormap,
+        **WORDCLOUD_OPTIONS
+    ).generate_from_frequencies(word_counts)
+    
+    return _encode_png(wordcloud, title, font_size)
+
+def _render_clouds(jobs, parallel=True):
+    """
+    Render a list of _render_cloud argument tuples; with parallel, a process renders
+    each cloud when more than one core is available, as the clouds are independent
+    """
+    workers = min(len(jobs), os.cpu_count() or 1)
+    if not parallel or workers < 2:
+        return [_render_cloud(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_cloud, *zip(*jobs)))
 
 class WordCloudGenerator:
     def __init__(self):
-        self.stop_words = set(['the', 'is', 'at', 'which', 'on', 'and', 'a', 'an', 'in', 
-                               'to', 'for', 'of', 'with', 'as', 'by', 'that', 'this', 
-                               'it', 'from', 'or', 'but', 'are', 'was', 'were', 'be',
-                               'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
-                               'could', 'should', 'may', 'might', 'must', 'can', 'shall',
-                               'we', 'our', 'us', 'them', 'they', 'their', 'these', 'those',
-                               'been', 'being', 'having', 'more', 'very', 'some', 'any'])
+        self.stop_words = WORDCLOUD_STOP_WORDS
     
-    def generate_wordcloud(self, text, max_words=50):
+    def generate_wordcloud(self, text, max_words=50, return_bytes=False):
         """
         Generate word cloud from text
+        Returns base64 PNG text, or the raw PNG bytes when return_bytes is True
         """
-        # Clean text
-        text = self._clean_text(text)
-        
-        # Create WordCloud object
-        wordcloud = WordCloud(
-            width=800,
-            height=400,
-            background_color='white',
-            stopwords=self.stop_words,
-            max_words=max_words,
-            relative_scaling=0.5,
-            colormap='viridis'
-        ).generate(text)
-        
-        # Generate image
-        fig, ax = plt.subplots(figsize=(10, 5))
-        ax.imshow(wordcloud, interpolation='bilinear')
-        ax.axis('off')
-        plt.title('Word Cloud - Stakeholder Comments', fontsize=16, pad=20)
-        plt.tight_layout(pad=0)
-        
-        # Convert to base64 for web display
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=100)
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()
-        
-        return image_base64
+        return self._render_wordcloud(self._count_words(text), max_words, return_bytes)
     
-    def generate_sentiment_wordclouds(self, sentiments_df):
+    def _render_wordcloud(self, word_counts, max_words=50, return_bytes=False):
+        """
+        Generate word cloud from precomputed word counts
+        """
+        return _png_output(_render_cloud(*self._main_cloud_args(word_counts, max_words)), return_bytes)
+    
+    def _main_cloud_args(self, word_counts, max_words):
+        """
+        Arguments to _render_cloud for the main and provision word clouds
+        """
+        return (_top_frequencies(word_counts, max_words), 'viridis', 'Word Cloud - Stakeholder Comments', max_words)
+    
+    def generate_sentiment_wordclouds(self, comments_df, sentiments_df, stats=None, return_bytes=False):
         """
         Generate separate word clouds for positive and negative sentiments
+        Rows of sentiments_df must line up with comments_df, as from analyze_comments_batch
         """
-        wordclouds = {}
-        
-        # Positive comments word cloud
-        positive_comments = sentiments_df[sentiments_df['sentiment'] == 'Positive']
-        if len(positive_comments) > 0:
-            positive_text = ' '.join(positive_comments['comment_text'].tolist())
-            wordclouds['positive'] = self._generate_colored_wordcloud(
-                positive_text, 'Greens', 'Positive Sentiment Word Cloud'
-            )
-        
-        # Negative comments word cloud
-        negative_comments = sentiments_df[sentiments_df['sentiment'] == 'Negative']
-        if len(negative_comments) > 0:
-            negative_text = ' '.join(negative_comments['comment_text'].tolist())
-            wordclouds['negative'] = self._generate_colored_wordcloud(
-                negative_text, 'Reds', 'Negative Sentiment Word Cloud'
-            )
+        per_sentiment_counter = self._prepare(comments_df, sentiments_df, stats).per_sentiment_counter
         
-        # Neutral comments word cloud
-        neutral_comments = sentiments_df[sentiments_df['sentiment'] == 'Neutral']
-        if len(neutral_comments) > 0:
-            neutral_text = ' '.join(neutral_comments['comment_text'].tolist())
-            wordclouds['neutral'] = self._generate_colored_wordcloud(
-                neutral_text, 'Blues', 'Neutral Sentiment Word Cloud'
-            )
+        wordclouds = {}
+        for sentiment, colormap in SENTIMENT_COLORMAPS:
+            # A cloud needs at least one word; short replies like 'N/A' leave none
+            if per_sentiment_counter.get(sentiment):
+                wordclouds[sentiment.lower()] = self._generate_colored_wordcloud(
+                    per_sentiment_counter[sentiment], colormap, f'{sentiment} Sentiment Word Cloud', return_bytes
+                )
         
         return wordclouds
     
-    def _generate_colored_wordcloud(self, text, colormap, title):
+    def _generate_colored_wordcloud(self, word_counts, colormap, title, return_bytes=False):
         """
-        Generate word cloud with specific color scheme
+        Generate word cloud with specific color scheme from precomputed word counts
         """
-        text = self._clean_text(text)
-        
-        wordcloud = WordCloud(
-            width=600,
-            height=300,
-            background_color='white',
-            stopwords=self.stop_words,
-            max_words=30,
-            relative_scaling=0.5,
-            colormap=colormap
-        ).generate(text)
-        
-        fig, ax = plt.subplots(figsize=(8, 4))
-        ax.imshow(wordcloud, interpolation='bilinear')
-        ax.axis('off')
-        plt.title(title, fontsize=14, pad=15)
-        plt.tight_layout(pad=0)
-        
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=100)
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()
-        
-        return image_base64
+        return _png_output(_render_cloud(*self._colored_cloud_args(word_counts, colormap, title)), return_bytes)
     
-    def _clean_text(self, text):
+    def _colored_cloud_args(self, word_counts, colormap, title):
         """
-        Clean text for word cloud generation
+        Arguments to _render_cloud for the smaller sentiment word clouds
         """
-        # Convert to lowercase
-        text = text.lower()
-        
-        # Remove special characters and digits
-        text = re.sub(r'[^a-zA-Z\s]', '', text)
-        
-        # Remove extra whitespace
-        text = ' '.join(text.split())
+        return (_top_frequencies(word_counts, 30), colormap, title, 30, 600, 300, 14)
+    
+    def _tokenize(self, text):
+        """
+        Clean text and return its non-stop-word tokens
+        """
+        return tokenize(text, self.stop_words)
+    
+    def _count_words(self, text):
+        """
+        Count non-stop-word tokens in text
+        """
+        return Counter(self._tokenize(text))
+    
+    def _count_texts(self, texts):
+        """
+        Count non-stop-word tokens across many texts without joining them into one string
+        """
+        word_counts = Counter()
+        for text in texts:
+            word_counts.update(self._tokenize(text))
+        return word_counts
+    
+    def _prepare(self, comments_df, sentiments_df, stats=None):
+        """
+        Return CorpusStats for the comments with the extra word cloud stop words removed
+        The shared stats only drop the common STOP_WORDS, so filtering their counts
+        gives the same result as tokenizing with WORDCLOUD_STOP_WORDS
+        """
+        if stats is None:
+            stats = prepare_corpus_stats(comments_df, sentiments_df)
         
-        return text
+        filter_counts = self._without_stop_words
+        return replace(
+            stats,
+            global_counter=filter_counts(stats.global_counter),
+            per_provision_counter={key: filter_counts(counts) for key, counts in stats.per_provision_counter.items()},
+            per_sentiment_counter={key: filter_counts(counts) for key, counts in stats.per_sentiment_counter.items()}
+        )
+    
+    def _without_stop_words(self, word_counts):
+        """
+        Copy a Counter without the word cloud stop words
+        """
+        stop_words = self.stop_words
+        return Counter({word: count for word, count in word_counts.items() if word not in stop_words})
     
     def get_word_frequency(self, text, top_n=20):
         """
         Get word frequency distribution
         """
-        # Clean text
-        text = self._clean_text(text)
-        
-        # Split into words
-        words = text.split()
-        
-        # Remove stop words
-        words = [word for word in words if word not in self.stop_words and len(word) > 3]
-        
-        # Count frequency
-        word_freq = Counter(words)
-        
-        # Get top N words
-        top_words = word_freq.most_common(top_n)
-        
-        return top_words
+        return self._top_words(self._count_words(text), top_n)
+    
+    def _top_words(self, word_counts, top_n=20):
+        """
+        Get the top N words longer than three letters from precomputed word counts
+        """
+        long_words = Counter({word: count for word, count in word_counts.items() if len(word) > 3})
+        return long_words.most_common(top_n)
     
-    def generate_provision_wordcloud(self, comments_df, provision):
+    def generate_provision_wordcloud(self, comments_df, provision, provision_text=None, return_bytes=False):
         """
         Generate word cloud for specific provision
+        provision_text can pass in the provision's combined comments, e.g. from
+        groupby('provision_reference')['comment_text'].agg(' '.join), to skip filtering
         """
-        # Filter comments for the provision
-        provision_comments = comments_df[comments_df['provision_reference'] == provision]
-        
-        if len(provision_comments) == 0:
-            return None
-        
-        # Combine all comments
-        text = ' '.join(provision_comments['comment_text'].tolist())
+        if provision_text is None:
+            # Filter comments for the provision
+            provision_comments = comments_df.loc[comments_df['provision_reference'] == provision, 'comment_text']
+            
+            if len(provision_comments) == 0:
+                return None
+            
+            # Count words comment by comment instead of combining them
+            return self._render_wordcloud(self._count_texts(provision_comments.to_numpy()), 30, return_bytes)
         
         # Generate word cloud
-        return self.generate_wordcloud(text, max_words=30)
+        return self.generate_wordcloud(provision_text, 30, return_bytes)
     
-    def create_frequency_chart_data(self, comments_df):
+    def create_frequency_chart_data(self, comments_df, stats=None):
         """
         Create data for frequency chart visualization
+        stats can pass in a CorpusStats for the comments to reuse its overall counts
         """
-        # Get all text
-        all_text = ' '.join(comments_df['comment_text'].tolist())
-        
-        # Get word frequency
-        word_freq = self.get_word_frequency(all_text, top_n=15)
+        # Get word frequency from the counts over all comments, streamed row by row
+        if stats is None:
+            word_counts = self._count_texts(comments_df['comment_text'].to_numpy())
+        else:
+            word_counts = self._without_stop_words(stats.global_counter)
+        return self._frequency_data(word_counts)
+    
+    def _frequency_data(self, word_counts):
+        """
+        Chart data for the most frequent words in precomputed word counts
+        """
+        word_freq = self._top_words(word_counts, top_n=15)
         
         # Prepare data for chart
         words = [item[0] for item in word_freq]
@@ -189,27 +251,49 @@ class WordCloudGenerator:
             'frequencies': frequencies
         }
     
-    def generate(self, df, sentiments_df):
+    def generate(self, df, sentiments_df, stats=None, return_bytes=False):
         """
         Main generation method that combines all word cloud generation functions
         Returns a dictionary with main word cloud and sentiment-based word clouds
+        stats can pass in a CorpusStats shared with the text summarizer; with
+        return_bytes the clouds are raw PNG bytes instead of base64 text
         """
-        # Generate main word cloud from all comments
-        all_text = ' '.join(df['comment_text'].tolist())
-        main_wordcloud = self.generate_wordcloud(all_text, max_words=50)
-        
-        # Generate sentiment-based word clouds
-        sentiment_wordclouds = self.generate_sentiment_wordclouds(sentiments_df)
+        # Tokenize and count words once; every cloud below reuses these counts
+        if stats is None:
+            stats = prepare_corpus_stats(df, sentiments_df)
+        wordcloud_stats = self._prepare(df, sentiments_df, stats)
+        per_provision_counter = wordcloud_stats.per_provision_counter
+        per_sentiment_counter = wordcloud_stats.per_sentiment_counter
         
-        # Get word frequency data for charts
-        frequency_data = self.create_frequency_chart_data(df)
+        # Collect the main, sentiment and top provision clouds so they can render concurrently;
+        # a cloud needs at least one word, so buckets of only short replies like 'N/A' are skipped
+        jobs = {}
+        if wordcloud_stats.global_counter:
+            jobs[('main', None)] = self._main_cloud_args(wordcloud_stats.global_counter, max_words=50)
+        for sentiment, colormap in SENTIMENT_COLORMAPS:
+            if per_sentiment_counter.get(sentiment):
+                jobs[('sentiment', sentiment.lower())] = self._colored_cloud_args(
+                    per_sentiment_counter[sentiment], colormap, f'{sentiment} Sentiment Word Cloud'
+                )
         
         # Generate provision-specific word clouds for top provisions
+        # Unused categories are counted too but have no word counts
         provision_counts = df['provision_reference'].value_counts()
+        provision_counts = provision_counts[provision_counts > 0]
         top_provisions = provision_counts.head(3).index.tolist()
-        provision_wordclouds = {}
         for provision in top_provisions:
-            provision_wordclouds[provision] = self.generate_provision_wordcloud(df, provision)
+            if per_provision_counter.get(provision):
+                jobs[('provision', provision)] = self._main_cloud_args(per_provision_counter[provision], max_words=30)
+        
+        # Small consultations render serially, where starting worker processes would dominate
+        pngs = _render_clouds(list(jobs.values()), parallel=len(df) >= PARALLEL_MIN_COMMENTS)
+        images = {key: _png_output(png, return_bytes) for key, png in zip(jobs, pngs)}
+        main_wordcloud = images.pop(('main', None), None)
+        sentiment_wordclouds = {name: image for (kind, name), image in images.items() if kind == 'sentiment'}
+        provision_wordclouds = {name: image for (kind, name), image in images.items() if kind == 'provision'}
+        
+        # Get word frequency data for charts
+        frequency_data = self._frequency_data(wordcloud_stats.global_counter)
         
         return {
             'main_wordcloud': main_wordcloud,